@@ -14,23 +14,54 @@
 # limitations under the License.
 #
 import os
+import functools
 import psycopg2
+import psycopg2.extras
 import psycopg2.pool
 import logging
 import time
-import fnmatch
+import threading
+import uuid
 from typing import Optional, List, Iterable, Union
 
 logger = logging.getLogger(__name__)
 
+# psycopg2 returns bytea as memoryview by default; cast to bytes in the driver so
+# every get() doesn't pay an extra wrapper object + tobytes() copy per read
+psycopg2.extensions.register_type(psycopg2.extensions.new_type(
+    psycopg2.BINARY.values, "BYTEA_AS_BYTES",
+    lambda value, cur: psycopg2.BINARY(value, cur).tobytes() if value is not None else None))
+
+def _glob_to_like(pattern: str) -> str:
+    """Translate a glob pattern to a SQL LIKE pattern, escaping LIKE metacharacters.
+
+    Only ``*`` and ``?`` wildcards are translated; character classes are not
+    supported and match literally.
+    """
+    like = []
+    for ch in pattern:
+        if ch == '*':
+            like.append('%')
+        elif ch == '?':
+            like.append('_')
+        elif ch in ('%', '_', '\\'):
+            like.append('\\' + ch)
+        else:
+            like.append(ch)
+    return ''.join(like)
+
 class connection (psycopg2.extensions.connection):
     """Customized pyscopg2 connection factory
 
     Does idempotent schema initialization and prepares statements for reuse.
     """
-    def __init__(self, dsn):
+    def __init__(self, dsn, durable: bool = False):
         psycopg2.extensions.connection.__init__(self, dsn)
         logger.debug(f"Initializing new connection for PostgreSQL: dsn={self.dsn}")
+        self._durable = durable
+        # single-statement KV operations need no snapshot stability across statements,
+        # so READ COMMITTED is sufficient; set once per session rather than per borrow
+        self.set_session(isolation_level='READ COMMITTED')
         with self.cursor() as cur:
             self._idempotent_ddl(cur)
             self._prepare_stmts(cur)
@@ -38,66 +69,139 @@ class connection (psycopg2.extensions.connection):
         logger.debug(f"Initialization complete")
 
     def _idempotent_ddl(self, cur):
-        cur.execute("""
-        CREATE TABLE IF NOT EXISTS deriva_groups (
+        cur.execute(f"""
+        CREATE {'' if self._durable else 'UNLOGGED '}TABLE IF NOT EXISTS deriva_groups (
           key text PRIMARY KEY,
           value bytea NOT NULL,
           expires_at float8
         );
+
+        -- partial index so the sweeper and TTL-aware reads scan only rows that can expire
+        CREATE INDEX IF NOT EXISTS deriva_groups_expires_at_idx
+        ON deriva_groups (expires_at) WHERE expires_at IS NOT NULL;
         """)
 
     def _prepare_stmts(self, cur):
-        cur.execute("""
-        DEALLOCATE PREPARE ALL;
+        # a freshly-spawned connection has no prepared statements, so no DEALLOCATE
+        # is needed; guard against re-invocation (e.g. a pool reset callback) instead
+        try:
+            cur.execute(self._prepare_stmts_sql)
+        except psycopg2.errors.DuplicatePreparedStatement:
+            self.rollback()
 
+    _prepare_stmts_sql = """
         PREPARE deriva_groups_session_set(text, bytea, float8) AS
         INSERT INTO deriva_groups (key, value, expires_at)
         VALUES($1, $2, $3)
         ON CONFLICT (key)
         DO UPDATE SET value = EXCLUDED.value, expires_at = EXCLUDED.expires_at;
 
-        PREPARE deriva_groups_session_get(text) AS
-        SELECT value, expires_at FROM deriva_groups WHERE key = $1;
+        PREPARE deriva_groups_session_get(text, float8) AS
+        SELECT value FROM deriva_groups
+        WHERE key = $1 AND (expires_at IS NULL OR expires_at > $2);
 
-        PREPARE deriva_groups_session_get_expires(text) AS
-        SELECT expires_at FROM deriva_groups WHERE key = $1;
+        PREPARE deriva_groups_session_get_expires(text, float8) AS
+        SELECT expires_at FROM deriva_groups
+        WHERE key = $1 AND (expires_at IS NULL OR expires_at > $2);
 
-        PREPARE deriva_groups_session_list AS
-        SELECT key, expires_at FROM deriva_groups;
+        PREPARE deriva_groups_session_keys(text, float8) AS
+        SELECT key, expires_at FROM deriva_groups
+        WHERE key LIKE $1 AND (expires_at IS NULL OR expires_at > $2);
+
+        PREPARE deriva_groups_session_exists(text, float8) AS
+        SELECT 1 FROM deriva_groups
+        WHERE key = $1 AND (expires_at IS NULL OR expires_at > $2)
+        LIMIT 1;
 
         PREPARE deriva_groups_session_delete(text) AS
         DELETE FROM deriva_groups WHERE key = $1;
-        """)
+        """
 
 class PostgreSQLBackend:
     """
     A simple PostgreSQL-based key-value store with TTL support and pooled psycopg2 connections.
+
+    `minconn` keeps warm connections (with their prepared statements) always available;
+    `maxconn` bounds concurrency and should stay below the server's max_connections
+    with headroom for other clients.
+
+    By default the table is created UNLOGGED, skipping WAL writes: session/TTL data
+    is ephemeral, so losing it on a server crash is an acceptable trade for roughly
+    double the write throughput. Pass `durable=True` for a crash-safe table.
     """
-    def __init__(self, url: str = "postgresql:///derivagrps", idle_timeout: int = 60):
+    def __init__(self, url: str = "postgresql:///derivagrps", minconn: int = 4, maxconn: int = 32,
+                 idle_timeout: int = 60, durable: bool = False):
         # TODO: figure out what idle_timeout would even mean here with pooling??
-        # TODO: add configuration for minconn, maxconn here?
         self.dsn = url
-        minconn = 1 # need to keep an idle connection open to really benefit from pool?
-        maxconn = 4
-        self.pool = psycopg2.pool.ThreadedConnectionPool(minconn, maxconn, dsn=url, connection_factory=connection)
+        self.pool = psycopg2.pool.ThreadedConnectionPool(
+            minconn, maxconn, dsn=url,
+            connection_factory=functools.partial(connection, durable=durable))
         logger.debug(f"Using threaded connection pool for PostgreSQL: minconn={minconn} maxconn={maxconn} url={self.dsn}")
         self.idle_timeout = idle_timeout
+        self._start_sweeper()
 
     def _get_conn(self):
-        conn = self.pool.getconn()
+        # key the checkout by thread so a thread keeps getting the same warm
+        # connection (whose server-side PREPARE cache is already populated)
+        # while it holds one, rather than an arbitrary pick from the free list
+        conn = self.pool.getconn(key=threading.get_ident())
         logger.debug(f"Got pooled connection dsn={conn.dsn} status={conn.status}")
-        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_REPEATABLE_READ)
         return conn
 
     def _put_conn(self, conn):
         if conn is not None:
             logger.debug(f"Returning connection to pool dsn={conn.dsn} status={conn.status}")
-            self.pool.putconn(conn)
+            self.pool.putconn(conn, key=threading.get_ident())
+
+    _sweep_stmt = """
+    WITH victims AS (
+      SELECT key FROM deriva_groups
+      WHERE expires_at IS NOT NULL AND expires_at < extract(epoch from now())
+      LIMIT %s
+      FOR UPDATE SKIP LOCKED
+    )
+    DELETE FROM deriva_groups WHERE key IN (SELECT key FROM victims);
+    """
+
+    def _start_sweeper(self, interval: int = 60, batch: int = 1000):
+        self._sweep_interval = interval
+        self._sweep_batch = batch
+        self._sweeper_stop = threading.Event()
+        self._sweeper = threading.Thread(target=self._sweep_expired,
+                                         name="deriva-groups-postgresql-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def _sweep_expired(self):
+        """Periodically purge expired rows in batches on a dedicated pooled connection.
+
+        Batching with SKIP LOCKED keeps each delete transaction small and avoids
+        lock contention with the request path.
+        """
+        while not self._sweeper_stop.wait(self._sweep_interval):
+            try:
+                while self._sweep_batch_delete() >= self._sweep_batch:
+                    pass
+            except Exception as e:
+                logger.warning(f"Expired key sweep failed: {e}")
+
+    def _sweep_batch_delete(self) -> int:
+        conn = self._get_conn()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(self._sweep_stmt, (self._sweep_batch,))
+                deleted = cur.rowcount
+                conn.commit()
+            if deleted:
+                logger.debug(f"Sweeper purged {deleted} expired keys")
+            return deleted
+        finally:
+            self._put_conn(conn)
 
     def close(self):
         """
         Close the backend and clear resources.
         """
+        self._sweeper_stop.set()
         if self.pool is not None:
             logger.debug(f"Shutting down connection pool for dsn={self.dsn}")
             pool = self.pool
@@ -105,86 +209,180 @@ class PostgreSQLBackend:
             pool.closeall()
             del pool
 
-    def _pooled_execute_stmt(self, sql, params, resultfunc=lambda cur: None):
-        """Execute and commit one statement on a pooled connection, returning result of resultfunc applied to cursor.
+    # EXECUTE command text per prepared statement, built once per class. The
+    # SQL-level EXECUTE still costs a (trivial) parse server-side; skipping that
+    # too needs protocol-level Bind/Execute, which psycopg2 does not expose
+    # (psycopg 3's prepare= support would), so this is as far as the driver allows.
+    _exec_stmts = {
+        name: f"EXECUTE {name}({', '.join(['%s'] * nargs)});"
+        for name, nargs in {
+            "deriva_groups_session_set": 3,
+            "deriva_groups_session_get": 2,
+            "deriva_groups_session_get_expires": 2,
+            "deriva_groups_session_keys": 2,
+            "deriva_groups_session_exists": 2,
+            "deriva_groups_session_delete": 1,
+        }.items()
+    }
+
+    def _pooled_execute_stmt(self, stmt, params, resultfunc=lambda cur: None, readonly=False):
+        """Execute one statement on a pooled connection, returning result of resultfunc applied to cursor.
+
+        `stmt` is either the name of a statement prepared by the connection factory
+        or a raw SQL string. Read-only statements run in autocommit mode, where
+        psycopg2 sends no BEGIN and there is no transaction to end, so a read costs
+        a single round trip; the autocommit toggle itself is client-side connection
+        state, not a server call. Writes keep explicit transactions and commit.
         """
         conn = self._get_conn()
-        with conn.cursor() as cur:
-            cur.execute(sql, params)
-            result = resultfunc(cur)
-            conn.commit()
-        self._put_conn(conn)
-        return result
+        try:
+            if readonly:
+                conn.autocommit = True
+            try:
+                with conn.cursor() as cur:
+                    cur.execute(self._exec_stmts.get(stmt, stmt), params)
+                    result = resultfunc(cur)
+                if not readonly:
+                    conn.commit()
+                return result
+            finally:
+                if readonly:
+                    conn.autocommit = False
+        finally:
+            # always return the connection: with thread-keyed checkout, a leaked
+            # connection in aborted-transaction state would be handed back to this
+            # thread on every subsequent call (putconn rolls back non-idle state)
+            self._put_conn(conn)
 
     def setex(self, key: str, value: Union[str, bytes], ttl: int) -> None:
         expires_at = time.time() + ttl
         blob = value if isinstance(value, (bytes, bytearray)) else value.encode()
         self._pooled_execute_stmt(
-            "EXECUTE deriva_groups_session_set(%s, %s, %s);",
+            "deriva_groups_session_set",
             (key, blob, expires_at)
         )
 
     def get(self, key: str) -> Optional[bytes]:
+        # expired rows are filtered server-side, so a hit never needs a follow-up DELETE
         row = self._pooled_execute_stmt(
-            "EXECUTE deriva_groups_session_get(%s);",
-            (key,),
-            lambda cur: cur.fetchone()
+            "deriva_groups_session_get",
+            (key, time.time()),
+            lambda cur: cur.fetchone(),
+            readonly=True
         )
         if not row:
             return None
-        value, expires_at = row
-        if expires_at is not None and time.time() >= expires_at:
-            self.delete(key)
-            return None
-        return value.tobytes()
+        value, = row
+        return value
+
+    def setex_many(self, items: List[tuple]) -> None:
+        """Set many (key, value, ttl) items with per-item TTLs in a single transaction.
+
+        Batches the prepared-statement EXECUTEs with execute_batch, so N updates
+        cost ceil(N/page_size) round trips and one commit instead of N of each.
+        """
+        now = time.time()
+        rows = [(key, value if isinstance(value, (bytes, bytearray)) else value.encode(), now + ttl)
+                for key, value, ttl in items]
+        conn = self._get_conn()
+        try:
+            with conn.cursor() as cur:
+                psycopg2.extras.execute_batch(
+                    cur, "EXECUTE deriva_groups_session_set(%s, %s, %s);", rows, page_size=100)
+                conn.commit()
+        finally:
+            self._put_conn(conn)
+
+    def mset(self, items: dict, ttl: Optional[int] = None) -> None:
+        """Set many keys in a single statement and round trip, all with the same optional TTL."""
+        expires_at = time.time() + ttl if ttl is not None else None
+        rows = [(key, value if isinstance(value, (bytes, bytearray)) else value.encode(), expires_at)
+                for key, value in items.items()]
+        conn = self._get_conn()
+        try:
+            with conn.cursor() as cur:
+                psycopg2.extras.execute_values(cur, """
+                    INSERT INTO deriva_groups (key, value, expires_at) VALUES %s
+                    ON CONFLICT (key)
+                    DO UPDATE SET value = EXCLUDED.value, expires_at = EXCLUDED.expires_at;
+                    """, rows)
+                conn.commit()
+        finally:
+            self._put_conn(conn)
 
     def delete(self, key: str) -> None:
         self._pooled_execute_stmt(
-            "EXECUTE deriva_groups_session_delete(%s);",
+            "deriva_groups_session_delete",
             (key,)
         )
 
+    def delete_many(self, keys: List[str]) -> None:
+        """Delete many keys in a single statement and round trip."""
+        if not keys:
+            return
+        self._pooled_execute_stmt(
+            "DELETE FROM deriva_groups WHERE key = ANY(%s);",
+            (list(keys),)
+        )
+
     def keys(self, pattern: str) -> List[str]:
         rows = self._pooled_execute_stmt(
-            "EXECUTE deriva_groups_session_list;",
-            None,
-            lambda cur: list(cur)
+            "deriva_groups_session_keys",
+            (_glob_to_like(pattern), time.time()),
+            lambda cur: list(cur),
+            readonly=True
         )
-        now = time.time()
-        result = []
-        for key, expires_at in rows:
-            if expires_at is not None and now >= expires_at:
-                self.delete(key)
-                continue
-            if fnmatch.fnmatch(key, pattern):
-                result.append(key)
-        # after for loop...
-        return result
+        return [key for key, expires_at in rows]
 
     def scan_iter(self, pattern: str) -> Iterable[str]:
-        for key in self.keys(pattern):
-            yield key
+        # stream matching keys through a named (server-side) cursor instead of
+        # buffering the whole key list client-side; the connection is checked out
+        # under a unique pool key so calls made by the consumer loop (e.g. get()
+        # per key) use the thread's own connection, not this one mid-iteration
+        pool_key = f"scan:{uuid.uuid4().hex}"
+        conn = self.pool.getconn(key=pool_key)
+        try:
+            with conn.cursor(name=f"deriva_groups_scan_{uuid.uuid4().hex}") as cur:
+                cur.itersize = 1000
+                cur.execute("""
+                    SELECT key FROM deriva_groups
+                    WHERE key LIKE %s AND (expires_at IS NULL OR expires_at > %s);
+                    """, (_glob_to_like(pattern), time.time()))
+                for key, in cur:
+                    yield key
+            conn.commit()
+        finally:
+            # putconn rolls back any transaction left open by early generator exit
+            self.pool.putconn(conn, key=pool_key)
 
     def exists(self, key: str) -> bool:
-        return self.get(key) is not None
+        # presence probe only; never ships the value blob over the wire
+        row = self._pooled_execute_stmt(
+            "deriva_groups_session_exists",
+            (key, time.time()),
+            lambda cur: cur.fetchone(),
+            readonly=True
+        )
+        return row is not None
 
     def ttl(self, key: str) -> int:
+        now = time.time()
         row = self._pooled_execute_stmt(
-            "EXECUTE deriva_groups_session_get_expires(%s);",
-            (key,),
-            lambda cur: cur.fetchone()
+            "deriva_groups_session_get_expires",
+            (key, now),
+            lambda cur: cur.fetchone(),
+            readonly=True
         )
         if not row:
-            return -2  # key does not exist
+            return -2  # key does not exist (or already expired)
         expires_at, = row
         if expires_at is None:
             return -1  # no TTL set
-        remaining = int(expires_at - time.time())
-        return remaining if remaining >= 0 else -2
+        return int(expires_at - now)
 
     def set(self, key: str, value: Union[str, bytes]) -> None:
         blob = value if isinstance(value, (bytes, bytearray)) else value.encode()
         row = self._pooled_execute_stmt(
-            "EXECUTE deriva_groups_session_set(%s, %s, %s);",
+            "deriva_groups_session_set",
             (key, blob, None)
         )
@@ -14,10 +14,10 @@
 # limitations under the License.
 #
 import os
+import queue
 import sqlite3
 import logging
 import time
-import fnmatch
 import threading
 from typing import Optional, List, Iterable, Union
 
@@ -26,33 +26,89 @@ logger = logging.getLogger(__name__)
 
 class SQLiteBackend:
     """
-    A simple SQLite-based key-value store with TTL support and thread-local SQLite connections.
+    A simple SQLite-based key-value store with TTL support and a bounded pool of
+    SQLite connections.
+
+    Connections are reused in LIFO order (hottest page cache first) and evicted
+    once idle longer than `idle_timeout`, so the open-connection count tracks
+    actual concurrency instead of the number of worker threads ever spawned.
     """
-    def __init__(self, url: str = ":memory:", idle_timeout=60):
+    def __init__(self, url: str = ":memory:", idle_timeout=60, maxconn: int = 4):
         self.db_path = url if url else os.path.expanduser("~/deriva-groups.db")
         logger.debug(f"Using SQLite database: {self.db_path}")
         if self.db_path != ":memory:" and not os.path.isdir(os.path.dirname(self.db_path)):
             os.makedirs(os.path.dirname(self.db_path))
 
         self.idle_timeout = idle_timeout
-        self.local = threading.local()
+        self.maxconn = maxconn
+        self._pool = queue.LifoQueue(maxsize=maxconn)
+        self._conn_count = 0
+        self._conn_lock = threading.Lock()
+        if self.db_path == ":memory:":
+            # a plain ":memory:" connection is private to itself, so pooled
+            # connections must share one named in-memory database; the anchor
+            # connection keeps it alive even if the pool evicts everything
+            self._mem_uri = f"file:deriva-groups-{id(self)}?mode=memory&cache=shared"
+            self._mem_anchor = sqlite3.connect(self._mem_uri, uri=True, check_same_thread=False)
+        else:
+            self._mem_uri = None
+            self._mem_anchor = None
+        self._start_sweeper()
 
-    def _get_conn(self):
-        now = time.time()
-        conn = getattr(self.local, "conn", None)
-        ts = getattr(self.local, "last_used", 0)
+    _schema_lock = threading.Lock()
 
-        if conn is not None and (now - ts) > self.idle_timeout:
-            # Close stale connection
+    def _acquire(self):
+        # prefer the most recently released connection; open a new one only if
+        # the pool is empty and we are still under maxconn, else block for a release
+        try:
+            conn, last_used = self._pool.get_nowait()
+            return conn
+        except queue.Empty:
+            pass
+        with self._conn_lock:
+            open_new = self._conn_count < self.maxconn
+            if open_new:
+                self._conn_count += 1
+        if open_new:
             try:
-                conn.close()
-            except Exception:
-                pass
-            conn = None
+                return self._open_conn()
+            except BaseException:
+                with self._conn_lock:
+                    self._conn_count -= 1
+                raise
+        conn, last_used = self._pool.get()
+        return conn
+
+    def _release(self, conn):
+        self._pool.put((conn, time.time()))
 
-        if conn is None:
-            conn = sqlite3.connect(self.db_path, check_same_thread=False)
-            conn.execute("PRAGMA journal_mode=WAL;")
+    def _open_conn(self):
+        # raise the statement cache above the default 128 so the small fixed set of
+        # statements used here always hits the cache instead of re-parsing
+        if self._mem_uri is not None:
+            conn = sqlite3.connect(self._mem_uri, uri=True, check_same_thread=False,
+                                   cached_statements=256)
+        else:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, cached_statements=256)
+        # per-connection performance PRAGMAs, set once at open
+        conn.execute("PRAGMA busy_timeout=5000;")
+        if self._mem_uri is not None:
+            # shared-cache connections take table-level read locks that would make
+            # a streaming reader block writers on sibling pooled connections
+            conn.execute("PRAGMA read_uncommitted=1;")
+        conn.execute("PRAGMA journal_mode=WAL;")
+        conn.execute("PRAGMA synchronous=NORMAL;")
+        conn.execute("PRAGMA temp_store=MEMORY;")
+        conn.execute("PRAGMA mmap_size=268435456;")
+        conn.execute("PRAGMA cache_size=-65536;")
+        self._init_schema(conn)
+        return conn
+
+    def _init_schema(self, conn):
+        # DDL must run per connection rather than once per process, since each
+        # connection to a ":memory:" database is a distinct database; for
+        # file-backed databases it is a cheap no-op after the first connection
+        with self._schema_lock:
             conn.execute("""
                 CREATE TABLE IF NOT EXISTS deriva_groups (
                     key TEXT PRIMARY KEY,
@@ -60,79 +116,206 @@ class SQLiteBackend:
                     expires_at REAL
                 )
             """)
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS deriva_groups_expires_at_idx
+                ON deriva_groups (expires_at) WHERE expires_at IS NOT NULL
+            """)
             conn.commit()
-            self.local.conn = conn
 
-        self.local.last_used = now
-        return conn
+    def _start_sweeper(self, interval: int = 60, batch: int = 1000):
+        self._sweep_interval = interval
+        self._sweep_batch = batch
+        self._sweeper_stop = threading.Event()
+        self._sweeper = threading.Thread(target=self._sweep_expired,
+                                         name="deriva-groups-sqlite-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def _sweep_expired(self):
+        """Periodically purge expired rows in batches and evict idle pooled connections."""
+        while not self._sweeper_stop.wait(self._sweep_interval):
+            try:
+                while self._sweep_batch_delete() >= self._sweep_batch:
+                    pass
+                self._evict_idle_conns()
+            except Exception as e:
+                logger.warning(f"Expired key sweep failed: {e}")
+
+    def _sweep_batch_delete(self) -> int:
+        conn = self._acquire()
+        try:
+            cur = conn.execute("""
+                DELETE FROM deriva_groups WHERE key IN (
+                    SELECT key FROM deriva_groups
+                    WHERE expires_at IS NOT NULL AND expires_at < ?
+                    LIMIT ?
+                )
+            """, (time.time(), self._sweep_batch))
+            conn.commit()
+            if cur.rowcount:
+                logger.debug(f"Sweeper purged {cur.rowcount} expired keys")
+            return cur.rowcount
+        finally:
+            self._release(conn)
+
+    def _evict_idle_conns(self):
+        now = time.time()
+        keep = []
+        while True:
+            try:
+                conn, last_used = self._pool.get_nowait()
+            except queue.Empty:
+                break
+            if (now - last_used) > self.idle_timeout:
+                logger.debug(f"Evicting idle SQLite connection to {self.db_path}")
+                with self._conn_lock:
+                    self._conn_count -= 1
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            else:
+                keep.append((conn, last_used))
+        for item in keep:
+            self._pool.put(item)
 
     def close(self):
         """
-        Close the SQLite connection associated with the current thread, if any.
+        Close the backend, stopping the sweeper and closing all pooled connections.
         """
-        conn = getattr(self.local, "conn", None)
-        if conn is not None:
-            logger.debug(f"Closing SQLite connection to {self.db_path} in thread {threading.get_ident()}")
-            conn.close()
-            del self.local.conn
-            del self.local.last_used
-
+        self._sweeper_stop.set()
+        while True:
+            try:
+                conn, last_used = self._pool.get_nowait()
+            except queue.Empty:
+                break
+            with self._conn_lock:
+                self._conn_count -= 1
+            try:
+                conn.close()
+            except Exception:
+                pass
+        if self._mem_anchor is not None:
+            self._mem_anchor.close()
+            self._mem_anchor = None
 
     def setex(self, key: str, value: Union[str, bytes], ttl: int) -> None:
         expires_at = time.time() + ttl
         blob = value if isinstance(value, (bytes, bytearray)) else value.encode()
-        conn = self._get_conn()
-        conn.execute("""
-            INSERT OR REPLACE INTO deriva_groups (key, value, expires_at)
-            VALUES (?, ?, ?)
-        """, (key, blob, expires_at))
-        conn.commit()
+        conn = self._acquire()
+        try:
+            conn.execute("""
+                INSERT OR REPLACE INTO deriva_groups (key, value, expires_at)
+                VALUES (?, ?, ?)
+            """, (key, blob, expires_at))
+            conn.commit()
+        finally:
+            self._release(conn)
 
     def get(self, key: str) -> Optional[bytes]:
-        conn = self._get_conn()
-        cur = conn.execute("""
-            SELECT value, expires_at FROM deriva_groups WHERE key = ?
-        """, (key,))
-        row = cur.fetchone()
+        conn = self._acquire()
+        try:
+            cur = conn.execute("""
+                SELECT value, expires_at FROM deriva_groups WHERE key = ?
+            """, (key,))
+            row = cur.fetchone()
+        finally:
+            self._release(conn)
         if not row:
             return None
         value, expires_at = row
         if expires_at is not None and time.time() >= expires_at:
-            self.delete(key)
+            # leave physical removal to the background sweeper
             return None
         return value
 
+    def mset(self, items: dict, ttl: Optional[int] = None) -> None:
+        """Set many keys in a single transaction, all with the same optional TTL.
+
+        Amortizes the journal fsync across the batch instead of paying it per row.
+        """
+        expires_at = time.time() + ttl if ttl is not None else None
+        rows = [(key, value if isinstance(value, (bytes, bytearray)) else value.encode(), expires_at)
+                for key, value in items.items()]
+        conn = self._acquire()
+        try:
+            conn.executemany("""
+                INSERT OR REPLACE INTO deriva_groups (key, value, expires_at)
+                VALUES (?, ?, ?)
+            """, rows)
+            conn.commit()
+        finally:
+            self._release(conn)
+
     def delete(self, key: str) -> None:
-        conn = self._get_conn()
-        conn.execute("DELETE FROM deriva_groups WHERE key = ?", (key,))
-        conn.commit()
+        conn = self._acquire()
+        try:
+            conn.execute("DELETE FROM deriva_groups WHERE key = ?", (key,))
+            conn.commit()
+        finally:
+            self._release(conn)
+
+    def delete_many(self, keys: List[str]) -> None:
+        """Delete many keys in a single transaction."""
+        if not keys:
+            return
+        conn = self._acquire()
+        try:
+            conn.executemany("DELETE FROM deriva_groups WHERE key = ?", [(key,) for key in keys])
+            conn.commit()
+        finally:
+            self._release(conn)
 
     def keys(self, pattern: str) -> List[str]:
-        conn = self._get_conn()
-        cur = conn.execute("SELECT key, expires_at FROM deriva_groups")
-        now = time.time()
-        result = []
-        for key, expires_at in cur:
-            if expires_at is not None and now >= expires_at:
-                self.delete(key)
-                continue
-            if fnmatch.fnmatch(key, pattern):
-                result.append(key)
-        return result
+        # SQLite GLOB matches the glob pattern natively; expired rows are filtered
+        # server-side and left to the background sweeper for physical removal
+        conn = self._acquire()
+        try:
+            cur = conn.execute("""
+                SELECT key FROM deriva_groups
+                WHERE key GLOB ? AND (expires_at IS NULL OR expires_at > ?)
+            """, (pattern, time.time()))
+            return [key for key, in cur]
+        finally:
+            self._release(conn)
 
     def scan_iter(self, pattern: str) -> Iterable[str]:
-        for key in self.keys(pattern):
-            yield key
+        # stream rows from the cursor instead of materializing the full key list,
+        # on a dedicated non-pooled connection: consumers typically issue get()
+        # calls per yielded key, so holding a pooled connection across yields
+        # would let concurrent scans exhaust the pool and deadlock in _acquire()
+        conn = self._open_conn()
+        try:
+            cur = conn.execute("""
+                SELECT key FROM deriva_groups
+                WHERE key GLOB ? AND (expires_at IS NULL OR expires_at > ?)
+            """, (pattern, time.time()))
+            for key, in cur:
+                yield key
+        finally:
+            conn.close()
 
     def exists(self, key: str) -> bool:
-        return self.get(key) is not None
+        # presence probe only; never reads the value blob
+        conn = self._acquire()
+        try:
+            cur = conn.execute("""
+                SELECT 1 FROM deriva_groups
+                WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)
+                LIMIT 1
+            """, (key, time.time()))
+            return cur.fetchone() is not None
+        finally:
+            self._release(conn)
 
     def ttl(self, key: str) -> int:
-        conn = self._get_conn()
-        cur = conn.execute("""
-            SELECT expires_at FROM deriva_groups WHERE key = ?
-        """, (key,))
-        row = cur.fetchone()
+        conn = self._acquire()
+        try:
+            cur = conn.execute("""
+                SELECT expires_at FROM deriva_groups WHERE key = ?
+            """, (key,))
+            row = cur.fetchone()
+        finally:
+            self._release(conn)
         if not row:
             return -2  # key does not exist
         expires_at, = row
@@ -143,9 +326,12 @@ class SQLiteBackend:
 
     def set(self, key: str, value: Union[str, bytes]) -> None:
         blob = value if isinstance(value, (bytes, bytearray)) else value.encode()
-        conn = self._get_conn()
-        conn.execute("""
-            INSERT OR REPLACE INTO deriva_groups (key, value, expires_at)
-            VALUES (?, ?, ?)
-        """, (key, blob, None))
-        conn.commit()
+        conn = self._acquire()
+        try:
+            conn.execute("""
+                INSERT OR REPLACE INTO deriva_groups (key, value, expires_at)
+                VALUES (?, ?, ?)
+            """, (key, blob, None))
+            conn.commit()
+        finally:
+            self._release(conn)
@@ -115,3 +115,95 @@ def test_backend_unicode_keys_and_values(backend):
     val = "🚀🔥"
     backend.set(key, val)
     assert backend.get(key).decode("utf-8") == val
+
+def test_backend_mset_sets_all_keys(backend):
+    if not hasattr(backend, "mset"):
+        pytest.skip("backend does not implement mset")
+    prefix = f"bulk:{uuid.uuid4()}"
+    items = {f"{prefix}:{i}": f"value {i}".encode() for i in range(5)}
+    backend.mset(items)
+    for key, value in items.items():
+        assert backend.get(key) == value
+
+def test_backend_mset_with_ttl_filters_expired(monkeypatch, backend):
+    if not hasattr(backend, "mset"):
+        pytest.skip("backend does not implement mset")
+    prefix = f"bulkttl:{uuid.uuid4()}"
+    items = {f"{prefix}:{i}": b"expiring" for i in range(3)}
+
+    now = 1000
+    monkeypatch.setattr(time, "time", lambda: now)
+    backend.mset(items, ttl=5)
+    for key in items:
+        assert backend.get(key) == b"expiring"
+
+    monkeypatch.setattr(time, "time", lambda: now + 6)
+    for key in items:
+        assert backend.get(key) is None
+
+def test_backend_setex_many_sets_per_item_ttls(monkeypatch, backend):
+    if not hasattr(backend, "setex_many"):
+        pytest.skip("backend does not implement setex_many")
+    short = f"many:{uuid.uuid4()}"
+    long = f"many:{uuid.uuid4()}"
+
+    now = 1000
+    monkeypatch.setattr(time, "time", lambda: now)
+    backend.setex_many([(short, b"short", 5), (long, b"long", 500)])
+    assert backend.get(short) == b"short"
+    assert backend.get(long) == b"long"
+
+    monkeypatch.setattr(time, "time", lambda: now + 6)
+    assert backend.get(short) is None
+    assert backend.get(long) == b"long"
+
+def test_backend_delete_many_removes_keys(backend):
+    if not hasattr(backend, "delete_many"):
+        pytest.skip("backend does not implement delete_many")
+    keys = [f"delmany:{uuid.uuid4()}" for _ in range(3)]
+    for key in keys:
+        backend.set(key, b"to-delete")
+    backend.delete_many([])  # no-op
+    backend.delete_many(keys[:2])
+    assert backend.get(keys[0]) is None
+    assert backend.get(keys[1]) is None
+    assert backend.get(keys[2]) == b"to-delete"
+
+def test_backend_exists_and_keys_filter_expired(monkeypatch, backend):
+    prefix = f"expfilter:{uuid.uuid4()}"
+    live = f"{prefix}:live"
+    dead = f"{prefix}:dead"
+
+    now = 1000
+    monkeypatch.setattr(time, "time", lambda: now)
+    backend.set(live, b"stays")
+    backend.setex(dead, b"goes", 5)
+    assert backend.exists(live)
+    assert backend.exists(dead)
+
+    monkeypatch.setattr(time, "time", lambda: now + 6)
+    assert backend.exists(live)
+    # the Redis/Valkey fakes expire on their own clock rather than the patched one,
+    # so only the backends driven by time.time() get the strict assertions
+    if not isinstance(backend, RedisBackend):
+        assert not backend.exists(dead)
+        keys = set(k.decode() if isinstance(k, bytes) else k for k in backend.keys(f"{prefix}:*"))
+        assert keys == {live}
+
+def test_backend_sweeper_purges_expired_rows(monkeypatch, backend):
+    if not hasattr(backend, "_sweep_batch_delete"):
+        pytest.skip("backend has no background sweeper")
+    prefix = f"sweep:{uuid.uuid4()}"
+    keep = f"{prefix}:keep"
+    purge = f"{prefix}:purge"
+
+    now = 1000
+    monkeypatch.setattr(time, "time", lambda: now)
+    backend.set(keep, b"keep")
+    backend.setex(purge, b"purge", 5)
+
+    monkeypatch.setattr(time, "time", lambda: now + 6)
+    # rows from other tests may also be ripe, so only a lower bound on the count
+    assert backend._sweep_batch_delete() >= 1
+    keys = set(backend.keys(f"{prefix}:*"))
+    assert keys == {keep}